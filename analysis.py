@@ -1,26 +1,36 @@
 from typing import *
 
-from pydantic import BaseModel, Field
+from pydantic import BaseModel, ConfigDict, Field
 
-from structure import Column, Table, Schema, RelationReference
+from structure import (
+    Column,
+    ReadableSchema,
+    ReadableTable,
+    RelationReference,
+    Table,
+)
 
 
 class SchemaReference(BaseModel):
+    model_config = ConfigDict(defer_build=True)
+
     name: str
     oid: int
 
     @classmethod
-    def from_structure(cls, schema: Schema) -> Self:
+    def from_structure(cls, schema: ReadableSchema) -> Self:
         return cls(name=schema.name, oid=schema.oid)
 
 
 class TableReference(BaseModel):
+    model_config = ConfigDict(defer_build=True)
+
     name: str
     oid: int
     schema_reference: SchemaReference
 
     @classmethod
-    def from_structure(cls, schema: Schema, table: Table) -> Self:
+    def from_structure(cls, schema: ReadableSchema, table: ReadableTable) -> Self:
         return cls(
             name=table.name,
             oid=table.oid,
@@ -29,11 +39,15 @@ class TableReference(BaseModel):
 
 
 class ColumnReference(BaseModel):
+    model_config = ConfigDict(defer_build=True)
+
     table_reference: TableReference
     column: Column
 
     @classmethod
-    def from_structure(cls, schema: Schema, table: Table, column: Column) -> Self:
+    def from_structure(
+        cls, schema: ReadableSchema, table: ReadableTable, column: Column
+    ) -> Self:
         return cls(
             table_reference=TableReference.from_structure(schema, table),
             column=column,
@@ -41,11 +55,15 @@ class ColumnReference(BaseModel):
 
 
 class LocalColumnReference(BaseModel):
+    model_config = ConfigDict(defer_build=True)
+
     relation: RelationReference
     column_name: str
 
 
 class ConstantValue(BaseModel):
+    model_config = ConfigDict(defer_build=True)
+
     classification: Literal["constant"] = "constant"
     type: str
 
@@ -66,12 +84,16 @@ class DataReference(BaseModel):
       be recontextualized if passed up through CTEs.
     """
 
+    model_config = ConfigDict(defer_build=True)
+
     classification: Literal["data"] = "data"
     ultimate_source: ColumnReference
     local_source: Optional[LocalColumnReference]
 
 
 class UnknownExpression(BaseModel):
+    model_config = ConfigDict(defer_build=True)
+
     classification: Literal["unknown"] = "unknown"
     reason: Optional[str] = None
 
@@ -108,6 +130,8 @@ class ResultColumn(BaseModel):
       auto-assigns to expressions.
     """
 
+    model_config = ConfigDict(defer_build=True)
+
     definition: ColumnDefinition = Field(discriminator="classification")
     name: Optional[str] = None
 
@@ -122,8 +146,10 @@ class ResultColumn(BaseModel):
         )
 
     @classmethod
-    def from_table_column(cls, schema: Schema, table: Table, column: Column) -> Self:
-        column_reference = ColumnReference.from_structure(schema, table, column)
+    def from_table_column(cls, table_reference: TableReference, column: Column) -> Self:
+        column_reference = ColumnReference(
+            table_reference=table_reference, column=column
+        )
         definition = DataReference(
             ultimate_source=column_reference,
             local_source=None,
@@ -150,18 +176,32 @@ class PkMapping(BaseModel):
       the `pk_columns` are known.
     """
 
+    model_config = ConfigDict(defer_build=True)
+
     pk_columns: List[str]
     data_columns: List[str]
 
 
-def _build_pk_mappings_from_table(table: Table) -> Generator[PkMapping, None, None]:
+def _build_pk_mappings_from_table(
+    table: ReadableTable,
+) -> Generator[PkMapping, None, None]:
     for lookup_column_set in table.lookup_column_sets:
         column_names = lookup_column_set.column_names
         data_columns = [c for c in table.columns if c not in column_names]
         yield PkMapping(pk_columns=column_names, data_columns=data_columns)
 
 
+# Relation structures cached by `RelationStructure.from_table` (see
+# `prefork.warm_structure`), keyed by the id of their table. Each entry also holds the
+# table itself so that its id can't be reused while the entry exists. This is kept
+# outside the `Table` model so that tables stay small, and so that they compare equal
+# whether or not a structure has been cached for them.
+_cached_relation_structures: Dict[int, Tuple[Table, "RelationStructure"]] = dict()
+
+
 class RelationStructure(BaseModel):
+    model_config = ConfigDict(defer_build=True)
+
     result_columns: List[ResultColumn]
     pk_mappings: List[PkMapping]
 
@@ -170,16 +210,43 @@ class RelationStructure(BaseModel):
         return next((c for c in self.result_columns if c.name == name), None)
 
     @classmethod
-    def from_table(cls, schema: Schema, table: Table) -> Self:
+    def from_table(
+        cls, schema: ReadableSchema, table: ReadableTable, cache: bool = False
+    ) -> Self:
+        """
+        Returns the structure cached for the table if there is one. Otherwise builds
+        it, caching it when `cache` is set (see `prefork.warm_structure`). Callers must
+        treat the result as read-only.
+
+        Only structures of `Table` models are cached. Those of compact tables (see
+        `compact_structure`) never are, since that would undo their compaction.
+        """
+        cacheable_table = table if isinstance(table, Table) else None
+        if cacheable_table:
+            entry = _cached_relation_structures.get(id(cacheable_table))
+            if entry and entry[0] is cacheable_table and isinstance(entry[1], cls):
+                return entry[1]
+
+        # All columns share one reference to their table.
+        table_reference = TableReference.from_structure(schema, table)
+
         def build_result_column(column: Column) -> ResultColumn:
-            return ResultColumn.from_table_column(schema, table, column)
+            return ResultColumn.from_table_column(table_reference, column)
 
         result_columns = [build_result_column(c) for c in table.columns.values()]
         pk_mappings = list(_build_pk_mappings_from_table(table))
 
-        return cls(result_columns=result_columns, pk_mappings=pk_mappings)
+        relation_structure = cls(result_columns=result_columns, pk_mappings=pk_mappings)
+        if cache and cacheable_table:
+            _cached_relation_structures[id(cacheable_table)] = (
+                cacheable_table,
+                relation_structure,
+            )
+        return relation_structure
 
 
 class NamedRelation(BaseModel):
+    model_config = ConfigDict(defer_build=True)
+
     reference: RelationReference
     structure: RelationStructure
@@ -14,12 +14,36 @@ from pglast.ast import (
     WithClause,
 )
 from pglast.enums import JoinType
-from pydantic import BaseModel
+from pydantic import BaseModel, ConfigDict
 
 from analysis import *
 from structure import *
 
 
+class _ReasonedError(Exception):
+    """
+    `reason` is a short, stable description of why a query can't be analyzed, suitable
+    for aggregating failures across many queries. Specifics (such as names from the
+    query) go in `detail`, which is only included in the message.
+    """
+
+    reason: str
+    detail: Optional[str]
+
+    def __init__(self, reason: str, detail: Optional[str] = None):
+        super().__init__(reason if detail is None else f"{reason}: {detail}")
+        self.reason = reason
+        self.detail = detail
+
+
+class UnsupportedQueryError(_ReasonedError, NotImplementedError):
+    """Raised for queries using constructs we don't (yet) handle"""
+
+
+class UnresolvableQueryError(_ReasonedError, ValueError):
+    """Raised for queries referencing things not present in the database structure"""
+
+
 # This maps relation names to `RelationStructure` values.
 type RelationsMap = Dict[str, RelationStructure]
 
@@ -29,6 +53,8 @@ type SchemasMap = Dict[Optional[str], RelationsMap]
 
 
 class ColumnResolution(BaseModel):
+    model_config = ConfigDict(defer_build=True)
+
     relation: RelationReference
     column: ResultColumn
 
@@ -75,7 +101,7 @@ def _assert_node_is_range_var_or_join_expr(node: Node) -> None:
         for item in node:
             _assert_node_is_range_var_or_join_expr(item)
     else:
-        raise NotImplementedError()
+        raise UnsupportedQueryError(f"Unsupported FROM item: {type(node).__name__}")
 
 
 def _build_schemas_map(relations: Iterable[NamedRelation]) -> SchemasMap:
@@ -90,37 +116,37 @@ def _build_schemas_map(relations: Iterable[NamedRelation]) -> SchemasMap:
 def _validate_with_clause(with_clause: WithClause) -> None:
     if with_clause.recursive:
         # Not supported yet
-        raise NotImplementedError()
+        raise UnsupportedQueryError("Recursive WITH clause")
 
 
 def _validate_cte(cte: CommonTableExpr) -> None:
     if not isinstance(cte.ctequery, SelectStmt):
         # We only support SELECT queries within CTEs for now.
-        raise NotImplementedError()
+        raise UnsupportedQueryError(f"CTE containing {type(cte.ctequery).__name__}")
     if cte.aliascolnames is not None:
         # Not supported yet
-        raise NotImplementedError()
+        raise UnsupportedQueryError("CTE column aliases")
     if cte.ctecolcollations is not None:
         # This seems esoteric enough that we may never need to support it
-        raise NotImplementedError()
+        raise UnsupportedQueryError("CTE column collations")
     if cte.ctecolnames is not None:
         # Not supported yet
-        raise NotImplementedError()
+        raise UnsupportedQueryError("CTE column names")
     if cte.ctecoltypes is not None:
         # This seems esoteric enough that we may never need to support it
-        raise NotImplementedError()
+        raise UnsupportedQueryError("CTE column types")
     if cte.ctecoltypmods is not None:
         # I don't understand this. Erring on the side of caution.
-        raise NotImplementedError()
+        raise UnsupportedQueryError("CTE column type modifiers")
     if cte.cterecursive:
         # Not supported yet
-        raise NotImplementedError()
+        raise UnsupportedQueryError("Recursive CTE")
     if cte.cycle_clause:
         # I don't know what this is. Erring on the side of caution.
-        raise NotImplementedError()
+        raise UnsupportedQueryError("CTE CYCLE clause")
     if cte.search_clause:
         # I don't know what this is. Erring on the side of caution.
-        raise NotImplementedError()
+        raise UnsupportedQueryError("CTE SEARCH clause")
 
 
 def _deduce_result_column_name(expr: Node) -> Optional[str]:
@@ -148,10 +174,12 @@ class Context:
     # ⚠️ It would be nice to consolidate and clean up some of this state (e.g. _ctes vs
     # _relations)
 
-    _database_structure: DatabaseStructure
-    _current_schema: Schema
+    _database_structure: ReadableDatabaseStructure
     _select_statement: SelectStmt
 
+    # Resolves relation names which are not qualified with a schema name.
+    _search_path_index: SearchPathIndex
+
     # The CTE relations in scope for use within this SELECT statement. They can be
     # defined inside the WITH clause of this SELECT statement or in a parent scope.
     _ctes: RelationsMap
@@ -162,26 +190,39 @@ class Context:
     # This stores _relations in a more convenient format for lookup by name.
     _schemas_map: SchemasMap
 
+    # This maps the name each relation is exposed as in the FROM clause (i.e. its alias
+    # if it has one) to every relation exposed with that name, along with the schema
+    # each belongs to. Tables from different schemas may share a name. The schema is
+    # None for CTEs and for aliased relations, which can't be referenced with a schema
+    # name.
+    _relations_by_name: Dict[str, List[Tuple[NamedRelation, Optional[str]]]]
+
     # This allows us to lookup columns by name when a column is referenced without a
     # qualifying relation name.
     _flat_columns: FlatColumnsMap
 
     def __init__(
         self,
-        database_structure: DatabaseStructure,
+        database_structure: ReadableDatabaseStructure,
         select_statement: SelectStmt,
-        ctes: RelationsMap = dict(),
+        ctes: Optional[RelationsMap] = None,
+        search_path: Optional[Sequence[str]] = None,
     ):
         self._database_structure = database_structure
         self._select_statement = select_statement
-        current_schema = database_structure.schemas.get(
-            database_structure.current_schema
+        uses_current_schema = (
+            search_path is None and database_structure.search_path is None
         )
-        if not current_schema:
+        if (
+            uses_current_schema
+            and database_structure.current_schema not in database_structure.schemas
+        ):
             raise ValueError("Current schema not found in database structure.")
-        self._current_schema = current_schema
+        self._search_path_index = database_structure.get_search_path_index(search_path)
 
-        self._ctes = ctes
+        # A fresh map is needed for each top-level query so that CTEs don't leak from
+        # one query into the next.
+        self._ctes = dict() if ctes is None else ctes
         if select_statement.withClause:
             _validate_with_clause(select_statement.withClause)
             for cte in select_statement.withClause.ctes:
@@ -192,6 +233,7 @@ class Context:
         # ⚠️ I don't like how we're calling this instance method within the constructor.
         # It would be nice to refactor this out to avoid uninitialized class properties
         # as the code grows.
+        self._relations_by_name = dict()
         self._relations = list(self._get_referenced_relations(select_statement))
 
         self._schemas_map = _build_schemas_map(self._relations)
@@ -205,13 +247,15 @@ class Context:
             database_structure=self._database_structure,
             select_statement=select_statement,
             ctes=self._ctes,
+            search_path=self._search_path_index.search_path,
         )
 
     def _resolve_relation(
         self, schema_name: Optional[str], relation_name: str
-    ) -> Optional[RelationStructure]:
+    ) -> Optional[Tuple[RelationStructure, Optional[str]]]:
         """
-        Searches the current scope to find a relation (table/view/CTE) by name
+        Searches the current scope to find a relation (table/view/CTE) by name. Returns
+        the relation along with the name of the schema it belongs to (None for CTEs).
         """
         if schema_name:
             schema = self._database_structure.schemas.get(schema_name)
@@ -220,15 +264,16 @@ class Context:
             table = schema.tables.get(relation_name)
             if table is None:
                 return None
-            return RelationStructure.from_table(schema, table)
+            return RelationStructure.from_table(schema, table), schema.name
         else:
             cte = self._ctes.get(relation_name)
             if cte:
-                return cte
-            table = self._current_schema.tables.get(relation_name)
-            if not table:
+                return cte, None
+            schema_and_table = self._search_path_index.get_table(relation_name)
+            if schema_and_table is None:
                 return None
-            return RelationStructure.from_table(self._current_schema, table)
+            schema, table = schema_and_table
+            return RelationStructure.from_table(schema, table), schema.name
 
     def _get_referenced_relations(
         self, node: Node
@@ -257,19 +302,27 @@ class Context:
         # `RangeVar` represents a table/view/CTE name, possibly qualified with a schema
         # name.
         elif isinstance(node, RangeVar):
-            columns_map = self._resolve_relation(node.schemaname, node.relname)
-            if not columns_map:
-                raise ValueError(f"Unable to resolve relation: {node}")
+            resolved = self._resolve_relation(node.schemaname, node.relname)
+            if not resolved:
+                raise UnresolvableQueryError(
+                    "Unable to resolve relation", node.relname
+                )
+            columns_map, relation_schema_name = resolved
             name = node.relname
             if node.alias:
                 if node.alias.colnames:
                     # We have not yet handled column aliases defined in the FROM clause.
-                    raise NotImplementedError()
+                    raise UnsupportedQueryError("Column aliases in FROM clause")
                 name = node.alias.aliasname
-            yield NamedRelation(
+                relation_schema_name = None
+            relation = NamedRelation(
                 reference=RelationReference(name=name, schema_name=node.schemaname),
                 structure=columns_map,
             )
+            self._relations_by_name.setdefault(name, []).append(
+                (relation, relation_schema_name)
+            )
+            yield relation
 
         # `JoinExpr` represents a JOIN clause. We need to recurse into the left and
         # right.
@@ -277,23 +330,25 @@ class Context:
             if node.alias or node.join_using_alias:
                 # `alias` and `join_using_alias` are more esoteric features that we
                 # don't need to handle for now. They do NOT represent a table alias.
-                raise NotImplementedError()
+                raise UnsupportedQueryError("Aliased JOIN")
             if node.jointype not in [JoinType.JOIN_INNER, JoinType.JOIN_LEFT]:
                 # We only attempt to handle INNER and LEFT joins for now.
-                raise NotImplementedError()
+                raise UnsupportedQueryError(
+                    f"Unsupported join type: {node.jointype.name}"
+                )
             if node.isNatural:
                 # We don't try to handle natural joins for now.
-                raise NotImplementedError()
+                raise UnsupportedQueryError("NATURAL JOIN")
             if node.usingClause:
                 # We don't try to handle USING clauses for now.
-                raise NotImplementedError()
+                raise UnsupportedQueryError("JOIN with USING clause")
             _assert_node_is_range_var_or_join_expr(node.larg)
             _assert_node_is_range_var_or_join_expr(node.rarg)
             yield from self._get_referenced_relations(node.larg)
             yield from self._get_referenced_relations(node.rarg)
 
         else:
-            raise NotImplementedError()
+            raise UnsupportedQueryError(f"Unsupported FROM item: {type(node).__name__}")
 
     def _resolve_column(
         self,
@@ -301,29 +356,28 @@ class Context:
         relation_name: Optional[str],
         column_name: str,
     ) -> Optional[ColumnResolution]:
-        current_schema = self._database_structure.current_schema
-
         if relation_name is None:
             return self._flat_columns.get(column_name)
 
-        relations_map = (
-            self._schemas_map.get(schema_name)
-            if schema_name
-            else self._schemas_map.get(current_schema, self._schemas_map.get(None))
-        )
-        if relations_map is None:
-            return None
-
-        relation_structure = relations_map.get(relation_name)
-        if relation_structure is None:
+        # As in PostgreSQL, a qualified column reference matches a relation in the FROM
+        # clause by the name it's exposed as, regardless of how the relation was
+        # qualified there. If the column reference also names a schema, that must be
+        # the schema the relation actually belongs to.
+        candidates = [
+            (relation, relation_schema_name)
+            for relation, relation_schema_name in self._relations_by_name.get(
+                relation_name, []
+            )
+            if schema_name is None or schema_name == relation_schema_name
+        ]
+        if len(candidates) != 1:
+            # Either no relation matches, or the reference is ambiguous.
             return None
-        column = relation_structure.get_column(column_name)
+        [(relation, _)] = candidates
+        column = relation.structure.get_column(column_name)
         if column is None:
             return None
-        return ColumnResolution(
-            relation=RelationReference(name=relation_name, schema_name=schema_name),
-            column=column,
-        )
+        return ColumnResolution(relation=relation.reference, column=column)
 
     def _get_relations(self) -> List[NamedRelation]:
         return self._relations
@@ -373,7 +427,9 @@ class Context:
             return column.recontextualize(local_column_reference, name)
 
         else:
-            raise NotImplementedError()
+            raise UnsupportedQueryError(
+                f"Unsupported expression: {type(expr).__name__}"
+            )
 
     def _build_result_columns(self, stmt: SelectStmt):
         for res_target in stmt.targetList:
@@ -386,7 +442,7 @@ class Context:
                 #
                 # I don't understand it well enough so I'm erring on the side of caution by
                 # raising an error if encountered.
-                raise NotImplementedError()
+                raise UnsupportedQueryError("Result column with indirection")
 
             yield self._build_result_column(res_target.val, res_target.name)
 
@@ -468,22 +524,63 @@ class Context:
             pk_mappings=pk_mappings,
         )
 
+    def stream_relation_structure(
+        self,
+    ) -> Generator[ResultColumn, None, List[PkMapping]]:
+        """
+        Yields each result column as soon as it is built, then returns the PkMappings
+        (which can only be built once all result columns are known).
+        """
+        result_columns: List[ResultColumn] = []
+        for column in self._build_result_columns(self._select_statement):
+            result_columns.append(column)
+            yield column
+        return self._build_pk_mappings(result_columns)
+
 
-def analyze_sql(database_structure: DatabaseStructure, sql: str) -> RelationStructure:
+def _parse_select_statement(sql: str) -> SelectStmt:
     try:
         ast = parse_sql(sql)
     except Exception as e:
         # Invalid input
-        raise NotImplementedError()
+        raise UnsupportedQueryError("Invalid SQL", str(e))
 
     if len(ast) != 1:
         # Zero or multi-statement input
-        raise NotImplementedError()
+        raise UnsupportedQueryError("Expected 1 statement", f"Got {len(ast)}.")
 
     first_statement = ast[0].stmt
     if isinstance(first_statement, SelectStmt):
-        cx = Context(database_structure, first_statement)
-        return cx.get_relation_structure()
+        return first_statement
     else:
         # Non-SELECT input
-        raise NotImplementedError()
+        raise UnsupportedQueryError(
+            f"Unsupported statement: {type(first_statement).__name__}"
+        )
+
+
+def analyze_sql(
+    database_structure: ReadableDatabaseStructure,
+    sql: str,
+    search_path: Optional[Sequence[str]] = None,
+) -> RelationStructure:
+    """
+    `search_path` overrides the search path of the database structure for this query.
+    """
+    select_statement = _parse_select_statement(sql)
+    cx = Context(database_structure, select_statement, search_path=search_path)
+    return cx.get_relation_structure()
+
+
+def stream_sql(
+    database_structure: ReadableDatabaseStructure,
+    sql: str,
+    search_path: Optional[Sequence[str]] = None,
+) -> Generator[ResultColumn, None, List[PkMapping]]:
+    """
+    Like `analyze_sql`, but yields result columns as they are produced. See
+    `Context.stream_relation_structure`.
+    """
+    select_statement = _parse_select_statement(sql)
+    cx = Context(database_structure, select_statement, search_path=search_path)
+    return cx.stream_relation_structure()
@@ -0,0 +1,197 @@
+"""
+An asyncio API for running analyses without blocking the event loop.
+"""
+
+import asyncio
+from concurrent.futures import Executor, ProcessPoolExecutor, ThreadPoolExecutor
+from typing import *
+
+from analysis import RelationStructure
+from analyze import analyze_sql
+from structure import ReadableDatabaseStructure
+
+# The structure used by `_analyze_in_worker_process`. Set once per worker process by
+# `_initialize_worker_process` so that it doesn't need to be pickled for each query.
+_worker_structure: Optional[ReadableDatabaseStructure] = None
+
+
+def _initialize_worker_process(
+    database_structure: ReadableDatabaseStructure,
+) -> None:
+    global _worker_structure
+    _worker_structure = database_structure
+
+
+def _analyze_in_worker_process(
+    sql: str, search_path: Optional[Tuple[str, ...]]
+) -> RelationStructure:
+    if _worker_structure is None:
+        raise ValueError("Worker process was not initialized with a structure.")
+    return analyze_sql(_worker_structure, sql, search_path)
+
+
+# (sql, search_path)
+type _RequestKey = Tuple[str, Optional[Tuple[str, ...]]]
+
+
+class AnalyzerBusyError(RuntimeError):
+    """Raised when an `AsyncAnalyzer` already has `max_pending` analyses pending"""
+
+
+class AsyncAnalyzer:
+    """
+    Runs `analyze_sql` in an executor pool, with at most `max_concurrency` analyses in
+    progress at once. Further requests wait for a free slot. At most `max_pending`
+    distinct analyses may be running or waiting at once; beyond that, new requests
+    are rejected with `AnalyzerBusyError` so that callers can shed load.
+
+    Concurrent requests with identical SQL and search path are coalesced, so that only
+    one analysis runs and all callers receive its result. SQL is compared exactly, not
+    by normalized fingerprint, because aliases and other details that fingerprints
+    ignore affect the result.
+
+    Cancelling a call (or having it time out) only affects that caller, unless it was
+    the last caller waiting for that analysis, in which case the analysis is
+    cancelled too. An analysis that has already started in the pool can't be
+    interrupted, so it keeps its slot until it finishes, and its result is discarded.
+
+    `executor` may be "thread", "process", or an existing `Executor`. When an existing
+    executor is given, it is not shut down by `close` and must be able to run
+    `analyze_sql` with the structure (i.e. a process pool must be initialized
+    elsewhere).
+    """
+
+    _database_structure: ReadableDatabaseStructure
+    _executor: Executor
+    _owns_executor: bool
+    _is_process_pool: bool
+    _semaphore: asyncio.Semaphore
+    _max_pending: int
+    _in_flight: Dict[_RequestKey, "asyncio.Task[RelationStructure]"]
+    # The number of callers awaiting each task in `_in_flight`
+    _waiter_counts: Dict[_RequestKey, int]
+
+    def __init__(
+        self,
+        database_structure: ReadableDatabaseStructure,
+        executor: Union[Literal["thread", "process"], Executor] = "thread",
+        max_concurrency: int = 4,
+        max_pending: int = 64,
+    ):
+        if max_concurrency < 1:
+            raise ValueError("max_concurrency must be at least 1.")
+        if max_pending < max_concurrency:
+            raise ValueError("max_pending must be at least max_concurrency.")
+        self._database_structure = database_structure
+        self._semaphore = asyncio.Semaphore(max_concurrency)
+        self._max_pending = max_pending
+        self._in_flight = dict()
+        self._waiter_counts = dict()
+        if executor == "thread":
+            self._executor = ThreadPoolExecutor(max_workers=max_concurrency)
+            self._owns_executor = True
+            self._is_process_pool = False
+        elif executor == "process":
+            self._executor = ProcessPoolExecutor(
+                max_workers=max_concurrency,
+                initializer=_initialize_worker_process,
+                initargs=(database_structure,),
+            )
+            self._owns_executor = True
+            self._is_process_pool = True
+        elif isinstance(executor, Executor):
+            self._executor = executor
+            self._owns_executor = False
+            self._is_process_pool = isinstance(executor, ProcessPoolExecutor)
+        else:
+            raise ValueError(f"Unsupported executor: {executor}")
+
+    async def _run(
+        self, sql: str, search_path: Optional[Tuple[str, ...]]
+    ) -> RelationStructure:
+        async with self._semaphore:
+            if self._is_process_pool:
+                job = self._executor.submit(
+                    _analyze_in_worker_process, sql, search_path
+                )
+            else:
+                job = self._executor.submit(
+                    analyze_sql, self._database_structure, sql, search_path
+                )
+            result = asyncio.wrap_future(job)
+            try:
+                # Shielded so that cancelling this task doesn't mark the job's future
+                # as cancelled while the job is still running.
+                return await asyncio.shield(result)
+            except asyncio.CancelledError:
+                if not job.cancel():
+                    # The job has started and can't be interrupted. Keep its slot
+                    # until it finishes so that the pool isn't oversubscribed.
+                    await asyncio.wait([result])
+                raise
+
+    def _get_task(self, key: _RequestKey) -> "asyncio.Task[RelationStructure]":
+        task = self._in_flight.get(key)
+        if task is None:
+            if len(self._in_flight) >= self._max_pending:
+                raise AnalyzerBusyError(
+                    f"{len(self._in_flight)} analyses are already pending."
+                )
+            task = asyncio.create_task(self._run(*key))
+            self._in_flight[key] = task
+            self._waiter_counts[key] = 0
+            task.add_done_callback(lambda _: self._forget(key, task))
+        return task
+
+    def _forget(
+        self, key: _RequestKey, task: "asyncio.Task[RelationStructure]"
+    ) -> None:
+        # A newer task may have replaced this one if it was cancelled.
+        if self._in_flight.get(key) is task:
+            del self._in_flight[key]
+            del self._waiter_counts[key]
+
+    def _release(
+        self, key: _RequestKey, task: "asyncio.Task[RelationStructure]"
+    ) -> None:
+        if self._in_flight.get(key) is not task:
+            return
+        self._waiter_counts[key] -= 1
+        if self._waiter_counts[key] == 0 and not task.done():
+            # Nobody is waiting for the result anymore. Forget the task right away, so
+            # that new callers don't join a task that is being cancelled.
+            self._forget(key, task)
+            task.cancel()
+
+    async def analyze_sql(
+        self,
+        sql: str,
+        search_path: Optional[Sequence[str]] = None,
+        timeout: Optional[float] = None,
+    ) -> RelationStructure:
+        """
+        Raises `TimeoutError` if the result is not available within `timeout` seconds,
+        and `AnalyzerBusyError` if too many analyses are already pending. The result is
+        shared with any coalesced callers and must be treated as read-only.
+        """
+        key: _RequestKey = (sql, None if search_path is None else tuple(search_path))
+        task = self._get_task(key)
+        self._waiter_counts[key] += 1
+        try:
+            # Shielding keeps one caller's cancellation from cancelling the shared
+            # task. `_release` cancels it once no callers remain.
+            return await asyncio.wait_for(asyncio.shield(task), timeout)
+        finally:
+            self._release(key, task)
+
+    async def close(self) -> None:
+        for task in list(self._in_flight.values()):
+            task.cancel()
+        if self._owns_executor:
+            self._executor.shutdown(wait=False, cancel_futures=True)
+
+    async def __aenter__(self) -> Self:
+        return self
+
+    async def __aexit__(self, *exc_info: Any) -> None:
+        await self.close()
@@ -0,0 +1,105 @@
+#!/usr/bin/env python
+
+"""
+Measures the cold start latency of the CLI.
+
+```
+./benchmarks/startup.py [--runs N] [--budget-ms MS]
+```
+
+Each run is a fresh interpreter, either printing `--help` or analyzing a trivial query,
+so the measured time is dominated by imports and model construction. The slowest
+imports of a query run are also reported, as measured by `python -X importtime`.
+
+Only `--help` is checked against the budget. Analyzing a query must import pglast and
+pydantic and build the models it uses, so its time is reported for comparison but not
+enforced.
+"""
+
+import argparse
+import statistics
+import subprocess
+import sys
+import time
+from pathlib import Path
+from typing import *
+
+ROOT = Path(__file__).resolve().parent.parent
+CLI = ROOT / "query-lens.py"
+STRUCTURE = ROOT / "tests" / "test_data" / "issue_tracker_schema.json"
+
+# Median wall time for one `--help` invocation, in milliseconds.
+DEFAULT_BUDGET_MS = 150.0
+
+QUERY_ARGS = ["-s", str(STRUCTURE), "-q", "SELECT id FROM issues;"]
+HELP_ARGS = ["--help"]
+
+
+def _build_command(cli_args: List[str], *extra_interpreter_args: str) -> List[str]:
+    return [sys.executable, *extra_interpreter_args, str(CLI), *cli_args]
+
+
+def time_invocation(cli_args: List[str]) -> float:
+    start = time.perf_counter()
+    subprocess.run(_build_command(cli_args), check=True, capture_output=True)
+    return (time.perf_counter() - start) * 1000
+
+
+def time_invocations(cli_args: List[str], runs: int) -> List[float]:
+    # Discard one run to warm the filesystem cache and bytecode cache.
+    time_invocation(cli_args)
+    return [time_invocation(cli_args) for _ in range(runs)]
+
+
+def _print_timings(label: str, timings: List[float]) -> None:
+    print(f"{label}:")
+    print(f"  min:    {min(timings):.1f} ms")
+    print(f"  median: {statistics.median(timings):.1f} ms")
+    print(f"  max:    {max(timings):.1f} ms")
+
+
+def get_slowest_imports(count: int) -> List[Tuple[int, str]]:
+    """Returns (cumulative microseconds, module name) for the slowest imports"""
+    completed = subprocess.run(
+        _build_command(QUERY_ARGS, "-X", "importtime"),
+        check=True,
+        capture_output=True,
+        text=True,
+    )
+    imports: List[Tuple[int, str]] = []
+    for line in completed.stderr.splitlines():
+        if not line.startswith("import time:") or "cumulative" in line:
+            continue
+        [_, cumulative, name] = line.split("|")
+        imports.append((int(cumulative), name.rstrip()))
+    imports.sort(reverse=True)
+    return imports[:count]
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--runs", type=int, default=20)
+    parser.add_argument("--budget-ms", type=float, default=DEFAULT_BUDGET_MS)
+    args = parser.parse_args()
+
+    help_timings = time_invocations(HELP_ARGS, args.runs)
+    query_timings = time_invocations(QUERY_ARGS, args.runs)
+    help_median = statistics.median(help_timings)
+
+    print(f"runs: {args.runs}")
+    _print_timings("--help", help_timings)
+    print(f"  budget: {args.budget_ms:.1f} ms")
+    _print_timings("query", query_timings)
+    print()
+    print("Slowest imports of a query (cumulative):")
+    for cumulative, name in get_slowest_imports(10):
+        print(f"  {cumulative / 1000:8.1f} ms {name}")
+
+    if help_median > args.budget_ms:
+        print()
+        print("Median --help time exceeds budget.")
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
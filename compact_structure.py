@@ -0,0 +1,230 @@
+"""
+A compact, read-only in-memory representation of a database structure, for very large
+databases.
+
+The pydantic models in `structure.py` cost several hundred bytes per column. Here,
+each table instead stores its columns as parallel tuples and arrays of interned
+strings and integers, and its lookup column sets as column indexes. `Column` and
+`LookupColumnSet` models are only built when accessed.
+
+When a compact structure is shared with forked workers (see `prefork`), only the
+search path index is built up front. Other derived data, such as each table's index of
+column names, is built lazily within each worker, and isn't shared.
+
+These classes implement the `Readable*` protocols of `structure.py`, so that
+`analyze_sql` and friends can use them interchangeably with the models. Use
+`load_compact_structure` to obtain one.
+"""
+
+import json
+import sys
+from array import array
+from typing import *
+
+from structure import (
+    Column,
+    LookupColumnSet,
+    SearchPathIndex,
+    SearchPathIndexCache,
+)
+
+
+class CompactColumns(Mapping[str, Column]):
+    """A read-only `dict[str, Column]` view of a `CompactTable`'s columns"""
+
+    __slots__ = ("_table",)
+
+    _table: "CompactTable"
+
+    def __init__(self, table: "CompactTable"):
+        self._table = table
+
+    def __getitem__(self, name: str) -> Column:
+        index = self._table.get_column_index(name)
+        if index is None:
+            raise KeyError(name)
+        return self._table.get_column(index)
+
+    def __contains__(self, name: object) -> bool:
+        return isinstance(name, str) and self._table.get_column_index(name) is not None
+
+    def __iter__(self) -> Iterator[str]:
+        return iter(self._table.column_names)
+
+    def __len__(self) -> int:
+        return len(self._table.column_names)
+
+    def values(self) -> ValuesView[Column]:
+        # The default implementation would look up each column by name.
+        return _CompactColumnValues(self)
+
+
+class _CompactColumnValues(ValuesView[Column]):
+    _mapping: CompactColumns
+
+    def __iter__(self) -> Iterator[Column]:
+        table = self._mapping._table
+        for index in range(len(table.column_names)):
+            yield table.get_column(index)
+
+
+class CompactTable:
+    __slots__ = (
+        "name",
+        "oid",
+        "column_names",
+        "_attnums",
+        "_types",
+        "_mutable",
+        "_lookup_column_sets",
+        "_column_indexes",
+    )
+
+    name: str
+    oid: int
+    column_names: Tuple[str, ...]
+    _attnums: array
+    _types: Tuple[str, ...]
+    # One byte per column: 1 if mutable, 0 otherwise.
+    _mutable: bytes
+    # Each lookup column set, as indexes into `column_names`.
+    _lookup_column_sets: Tuple[Tuple[int, ...], ...]
+    # Maps each column name to its index. Built on first lookup by name, so that only
+    # tables that are looked up by name pay for it. Analysis never does that, but note
+    # that after forking (see `prefork`), each worker builds its own copy for the tables
+    # it looks up, which are then no longer shared with the parent.
+    _column_indexes: Optional[Dict[str, int]]
+
+    def __init__(
+        self,
+        name: str,
+        oid: int,
+        columns: Iterable[Tuple[str, int, str, bool]],
+        lookup_column_sets: Iterable[Iterable[str]],
+    ):
+        """
+        `columns` holds one (name, attnum, type, mutable) tuple per column.
+        """
+        names: List[str] = []
+        attnums: List[int] = []
+        types: List[str] = []
+        mutable: List[int] = []
+        for column_name, attnum, column_type, is_mutable in columns:
+            names.append(sys.intern(column_name))
+            attnums.append(attnum)
+            types.append(sys.intern(column_type))
+            mutable.append(1 if is_mutable else 0)
+
+        self.name = sys.intern(name)
+        self.oid = oid
+        self.column_names = tuple(names)
+        self._attnums = array("i", attnums)
+        self._types = tuple(types)
+        self._mutable = bytes(mutable)
+        self._lookup_column_sets = tuple(
+            tuple(self.column_names.index(n) for n in column_names)
+            for column_names in lookup_column_sets
+        )
+        self._column_indexes = None
+
+    def get_column_index(self, name: str) -> Optional[int]:
+        if self._column_indexes is None:
+            self._column_indexes = {n: i for i, n in enumerate(self.column_names)}
+        return self._column_indexes.get(name)
+
+    def get_column(self, index: int) -> Column:
+        return Column.model_construct(
+            name=self.column_names[index],
+            attnum=self._attnums[index],
+            type=self._types[index],
+            mutable=bool(self._mutable[index]),
+        )
+
+    @property
+    def columns(self) -> CompactColumns:
+        return CompactColumns(self)
+
+    @property
+    def lookup_column_sets(self) -> List[LookupColumnSet]:
+        return [
+            LookupColumnSet.model_construct(
+                column_names=[self.column_names[i] for i in indexes]
+            )
+            for indexes in self._lookup_column_sets
+        ]
+
+
+class CompactSchema:
+    __slots__ = ("name", "oid", "tables")
+
+    name: str
+    oid: int
+    tables: Dict[str, CompactTable]
+
+    def __init__(self, name: str, oid: int, tables: Dict[str, CompactTable]):
+        self.name = sys.intern(name)
+        self.oid = oid
+        self.tables = tables
+
+
+class CompactDatabaseStructure:
+    __slots__ = ("schemas", "current_schema", "search_path", "_search_path_indexes")
+
+    schemas: Dict[str, CompactSchema]
+    current_schema: str
+    search_path: Optional[List[str]]
+    _search_path_indexes: SearchPathIndexCache
+
+    def __init__(
+        self,
+        schemas: Dict[str, CompactSchema],
+        current_schema: str,
+        search_path: Optional[List[str]] = None,
+    ):
+        self.schemas = schemas
+        self.current_schema = current_schema
+        self.search_path = search_path
+        self._search_path_indexes = SearchPathIndexCache()
+
+    def get_search_path_index(
+        self, search_path: Optional[Sequence[str]] = None
+    ) -> SearchPathIndex:
+        return self._search_path_indexes.get(self, search_path)
+
+
+def _build_compact_table(table: Dict[str, Any]) -> CompactTable:
+    columns = (
+        (c["name"], c["attnum"], c["type"], c["mutable"])
+        for c in table["columns"].values()
+    )
+    lookup_column_sets = (s["column_names"] for s in table["lookup_column_sets"])
+    return CompactTable(table["name"], table["oid"], columns, lookup_column_sets)
+
+
+def _build_compact_schema(schema: Dict[str, Any]) -> CompactSchema:
+    tables = {
+        sys.intern(name): _build_compact_table(table)
+        for name, table in schema["tables"].items()
+    }
+    return CompactSchema(schema["name"], schema["oid"], tables)
+
+
+def load_compact_structure(json_text: Union[str, bytes]) -> CompactDatabaseStructure:
+    """
+    Builds a compact structure from the same JSON accepted by
+    `DatabaseStructure.model_validate_json`, without ever building the full models.
+
+    Unlike pydantic validation, this does not check the types of values within the
+    JSON, so it should only be used with trusted input.
+
+    The result can be used anywhere a `ReadableDatabaseStructure` is accepted, but it
+    is read-only and is not a pydantic model.
+    """
+    data = json.loads(json_text)
+    schemas = {
+        sys.intern(name): _build_compact_schema(schema)
+        for name, schema in data["schemas"].items()
+    }
+    return CompactDatabaseStructure(
+        schemas, data["current_schema"], data.get("search_path")
+    )
@@ -0,0 +1,82 @@
+"""
+Serialization of analysis results for the CLI.
+
+All writers produce output byte-identical to `RelationStructure.model_dump_json` with
+the same `indent`, so streamed and non-streamed output can be used interchangeably.
+"""
+
+import json
+from typing import *
+
+from pydantic import BaseModel
+
+from analysis import PkMapping, ResultColumn
+
+
+def _nest(json_text: str, level: int, indent: Optional[int]) -> str:
+    """
+    Re-indents a pretty-printed JSON value so that it can be placed `level` levels deep
+    within another pretty-printed value. This is safe because JSON strings never
+    contain literal newlines.
+    """
+    if indent is None:
+        return json_text
+    return json_text.replace("\n", "\n" + " " * (indent * level))
+
+
+def _write_array(
+    out: TextIO, items: Iterable[BaseModel], level: int, indent: Optional[int]
+) -> None:
+    """Writes (and flushes) each item as soon as it is produced by `items`"""
+    newline = "" if indent is None else "\n"
+    inner_prefix = newline + ("" if indent is None else " " * (indent * (level + 1)))
+    outer_prefix = newline + ("" if indent is None else " " * (indent * level))
+    out.write("[")
+    is_empty = True
+    for item in items:
+        if not is_empty:
+            out.write(",")
+        out.write(inner_prefix)
+        out.write(_nest(item.model_dump_json(indent=indent), level + 1, indent))
+        out.flush()
+        is_empty = False
+    if not is_empty:
+        out.write(outer_prefix)
+    out.write("]")
+
+
+def stream_relation_structure(
+    out: TextIO,
+    columns: Generator[ResultColumn, None, List[PkMapping]],
+    indent: Optional[int] = None,
+) -> None:
+    """
+    Writes a relation structure while it is being analyzed, consuming the generator
+    returned by `analyze.stream_sql`.
+    """
+    newline = "" if indent is None else "\n"
+    field_prefix = newline + ("" if indent is None else " " * indent)
+    key_separator = ":" if indent is None else ": "
+
+    pk_mappings: List[PkMapping] = []
+
+    def capture_pk_mappings() -> Generator[ResultColumn, None, None]:
+        nonlocal pk_mappings
+        pk_mappings = yield from columns
+
+    out.write("{")
+    out.write(f'{field_prefix}"result_columns"{key_separator}')
+    _write_array(out, capture_pk_mappings(), 1, indent)
+    out.write(f',{field_prefix}"pk_mappings"{key_separator}')
+    _write_array(out, pk_mappings, 1, indent)
+    out.write(newline)
+    out.write("}")
+
+
+def format_error(error: Exception) -> str:
+    """
+    Returns a single line of JSON describing an error, for use in place of (or after
+    partial) analysis output.
+    """
+    details = {"type": type(error).__name__, "message": str(error)}
+    return json.dumps({"error": details}, separators=(",", ":"))
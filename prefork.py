@@ -0,0 +1,147 @@
+"""
+Support for sharing one parsed `DatabaseStructure` across a fleet of forked worker
+processes.
+
+Forked children share the parent's memory pages until something writes to them. The
+main thing that writes to _every_ page of a large structure is the cyclic garbage
+collector, which updates the header of each tracked object it traverses. By building
+derived data in the parent and then moving everything into the collector's permanent
+generation, children only copy the pages belonging to the objects a query actually
+touches.
+
+Typical usage in the parent process, before forking any workers:
+
+```python
+structure = load_structure_for_fork("structure.json")
+# ... fork workers, each of which calls `analyze_sql(structure, sql)`
+```
+"""
+
+import gc
+from typing import *
+
+from pydantic import BaseModel
+
+from analysis import (
+    ColumnReference,
+    ConstantValue,
+    DataReference,
+    LocalColumnReference,
+    NamedRelation,
+    PkMapping,
+    RelationStructure,
+    ResultColumn,
+    SchemaReference,
+    TableReference,
+    UnknownExpression,
+)
+from analyze import ColumnResolution, analyze_sql
+from structure import (
+    Column,
+    DatabaseStructure,
+    LookupColumnSet,
+    ReadableDatabaseStructure,
+    RelationReference,
+)
+
+# Every model built while analyzing. They all defer building their validators and
+# serializers until first use, which would otherwise happen privately in each worker.
+_ANALYSIS_MODELS: List[Type[BaseModel]] = [
+    RelationReference,
+    Column,
+    LookupColumnSet,
+    SchemaReference,
+    TableReference,
+    ColumnReference,
+    LocalColumnReference,
+    ConstantValue,
+    DataReference,
+    UnknownExpression,
+    ResultColumn,
+    PkMapping,
+    RelationStructure,
+    NamedRelation,
+    ColumnResolution,
+]
+
+
+def _quote_identifier(name: str) -> str:
+    return '"' + name.replace('"', '""') + '"'
+
+
+def _get_warm_up_query(database_structure: ReadableDatabaseStructure) -> Optional[str]:
+    """Returns a query selecting a column from some table, if there is one"""
+    for schema in database_structure.schemas.values():
+        for table in schema.tables.values():
+            for column_name in table.columns:
+                return (
+                    f"SELECT {_quote_identifier(column_name)} "
+                    f"FROM {_quote_identifier(schema.name)}."
+                    f"{_quote_identifier(table.name)}"
+                )
+    return None
+
+
+def warm_structure(
+    database_structure: ReadableDatabaseStructure, relation_structures: bool = False
+) -> None:
+    """
+    Eagerly builds derived data that `analyze_sql` would otherwise build privately,
+    within each worker, for each query.
+
+    The validators and serializers of the models built during analysis, and the index
+    for the structure's own search path, are always built. One query is also analyzed,
+    so that the interpreter specializes the code it runs here rather than in each
+    worker. Indexes for other search paths will still be built lazily in each worker.
+
+    When `relation_structures` is set, the `RelationStructure` of every table is also
+    built and cached for each table. This saves work in every query, but costs several
+    times the memory of the structure itself (once, shared by all workers). It is only
+    worthwhile for large fleets whose workers touch most tables. Compact structures
+    (see `compact_structure`) ignore it, and their tables' column name indexes are not
+    built here either, since analysis doesn't use them.
+    """
+    for model in _ANALYSIS_MODELS:
+        model.model_rebuild()
+    database_structure.get_search_path_index()
+    warm_up_query = _get_warm_up_query(database_structure)
+    if warm_up_query is not None:
+        analyze_sql(database_structure, warm_up_query).model_dump_json()
+    if not relation_structures:
+        return
+    for schema in database_structure.schemas.values():
+        for table in schema.tables.values():
+            RelationStructure.from_table(schema, table, cache=True)
+
+
+def freeze_structure[S: ReadableDatabaseStructure](
+    database_structure: S, relation_structures: bool = False
+) -> S:
+    """
+    Prepares an already-loaded structure to be shared by forked children. This must be
+    called in the parent process immediately before forking. See `warm_structure` for
+    `relation_structures`.
+
+    Note that `gc.freeze` applies to every object alive at the time of the call, not
+    only to the structure.
+    """
+    warm_structure(database_structure, relation_structures)
+    gc.collect()
+    gc.freeze()
+    return database_structure
+
+
+def load_structure_for_fork(
+    path: str, relation_structures: bool = False
+) -> DatabaseStructure:
+    # Disabling the collector while loading avoids creating holes in memory pages that
+    # later allocations in the children would fill (and thus copy).
+    gc_was_enabled = gc.isenabled()
+    gc.disable()
+    try:
+        with open(path) as f:
+            database_structure = DatabaseStructure.model_validate_json(f.read())
+        return freeze_structure(database_structure, relation_structures)
+    finally:
+        if gc_was_enabled:
+            gc.enable()
@@ -1,18 +1,57 @@
 #!/usr/bin/env python
 
 import argparse
+import os
 import sys
+from typing import *
 
-from structure import DatabaseStructure
-from analyze import analyze_sql
+# Only modules needed to parse arguments are imported up front. Everything else is
+# imported below, once we know what we've been asked to do, so that `--help` and
+# argument errors stay fast.
 
 parser = argparse.ArgumentParser(description="SQL static analysis tool.")
 query_help = "The SQL query to analyze. Will be read from STDIN if not provided."
 parser.add_argument("-q", required=False, help=query_help)
 structure_help = "Path to the database structure JSON file"
 parser.add_argument("-s", required=True, help=structure_help)
+search_path_help = (
+    "Comma-separated schemas to search when resolving unqualified relation names. "
+    "Defaults to the search path of the database structure."
+)
+parser.add_argument("--search-path", required=False, help=search_path_help)
+format_help = "Output format for a single query. Defaults to pretty."
+parser.add_argument("-f", "--format", choices=["pretty", "compact"], help=format_help)
+stream_help = (
+    "Write each result column as soon as it is produced. If the analysis fails after "
+    'output has begun, the partial output is followed by an {"error": ...} line and '
+    "the exit status is 1."
+)
+parser.add_argument("--stream", action="store_true", help=stream_help)
+batch_help = (
+    "Analyze each statement in the input separately, writing one line of JSON per "
+    "statement as soon as it is analyzed. Statements that can't be analyzed produce "
+    'an {"error": ...} line.'
+)
+parser.add_argument("--batch", action="store_true", help=batch_help)
+stats_help = "With --batch, write statistics about the run to this path as JSON."
+parser.add_argument("--stats", required=False, help=stats_help)
 args = parser.parse_args()
 
+if args.batch and args.format == "pretty":
+    parser.error("--batch output is always compact")
+if args.batch and args.stream:
+    parser.error("--batch output is already written one statement at a time")
+if args.stats and not args.batch:
+    parser.error("--stats requires --batch")
+
+# Discovering pydantic plugins scans the metadata of every installed distribution the
+# first time a model is built. We don't use any plugins, so skip that unless the user
+# has explicitly configured it.
+os.environ.setdefault("PYDANTIC_DISABLE_PLUGINS", "__all__")
+
+from structure import DatabaseStructure
+from analyze import analyze_sql
+
 
 def get_structure() -> DatabaseStructure:
     with open(args.s) as f:
@@ -26,6 +65,91 @@ def get_query() -> str:
     return sys.stdin.read()
 
 
-analysis = analyze_sql(get_structure(), get_query())
+def get_search_path() -> Optional[List[str]]:
+    if args.search_path is None:
+        return None
+    return [schema_name.strip() for schema_name in args.search_path.split(",")]
+
+
+def run_single() -> None:
+    indent = None if args.format == "compact" else 2
+    if args.stream:
+        from analyze import stream_sql
+        from output import format_error, stream_relation_structure
+
+        columns = stream_sql(get_structure(), get_query(), get_search_path())
+        try:
+            stream_relation_structure(sys.stdout, columns, indent)
+        except Exception as e:
+            # Some output may already have been written, so we terminate it with an
+            # error line that consumers can detect.
+            sys.stdout.write("\n" + format_error(e) + "\n")
+            sys.stdout.flush()
+            print(f"{type(e).__name__}: {e}", file=sys.stderr)
+            sys.exit(1)
+        sys.stdout.write("\n")
+    else:
+        analysis = analyze_sql(get_structure(), get_query(), get_search_path())
+        print(analysis.model_dump_json(indent=indent))
+
+
+def split_statements(sql: str) -> List[str]:
+    """
+    Splits the input on semicolons between statements. Unlike `pglast.split`, this
+    keeps statements that don't begin with a keyword (such as misspelled ones), so that
+    every statement gets a line of output.
+    """
+    from pglast.parser import scan
+
+    try:
+        tokens = scan(sql)
+    except Exception:
+        # E.g. an unterminated string. We can't tell where statements end.
+        return [sql.strip()] if sql.strip() else []
+
+    statements: List[str] = []
+    start: Optional[int] = None
+    end = 0
+    for token in tokens:
+        if token.name == "ASCII_59":
+            if start is not None:
+                statements.append(sql[start : end + 1])
+            start = None
+        elif token.name not in ["SQL_COMMENT", "C_COMMENT"]:
+            if start is None:
+                start = token.start
+            end = token.end
+    if start is not None:
+        statements.append(sql[start : end + 1])
+    return statements
+
+
+def run_batch() -> None:
+    from output import format_error
+
+    analyze = analyze_sql
+    if args.stats:
+        from stats import StatsCollector
+
+        stats_collector = StatsCollector()
+        analyze = stats_collector.analyze_sql
+
+    structure = get_structure()
+    search_path = get_search_path()
+    for sql in split_statements(get_query()):
+        try:
+            line = analyze(structure, sql, search_path).model_dump_json()
+        except Exception as e:
+            line = format_error(e)
+        sys.stdout.write(line + "\n")
+        sys.stdout.flush()
+
+    if args.stats:
+        with open(args.stats, "w") as f:
+            f.write(stats_collector.get_stats().model_dump_json(indent=2))
+
 
-print(analysis.model_dump_json(indent=2))
+if args.batch:
+    run_batch()
+else:
+    run_single()
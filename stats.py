@@ -0,0 +1,285 @@
+"""
+Opt-in statistics for batch runs over a corpus of queries.
+
+Statistics from separate processes can be combined with `AnalysisStats.merge`, so each
+worker can collect its own and write them out as JSON for a later merge step.
+"""
+
+import time
+from collections import Counter
+from typing import *
+
+from pglast import parse_sql
+from pglast.ast import CommonTableExpr, JoinExpr, SelectStmt
+from pglast.visitors import Ancestor, Visitor
+from pydantic import BaseModel, ConfigDict
+
+from analysis import RelationStructure, UnknownExpression
+from analyze import analyze_sql
+from structure import ReadableDatabaseStructure
+
+# Upper bounds (in milliseconds) of the buckets in the `latency_ms` histogram. The
+# last bucket is unbounded.
+LATENCY_BUCKETS_MS = [0.1, 0.3, 1, 3, 10, 30, 100, 300, 1000]
+
+OK = "ok"
+
+# The `join_count` and `cte_depth` bucket for statements which could not be parsed.
+UNPARSED = "unparsed"
+
+
+def _merge_counts[K](a: Dict[K, int], b: Dict[K, int]) -> Dict[K, int]:
+    return dict(Counter(a) + Counter(b))
+
+
+def _get_failure_reason(error: Exception) -> str:
+    """
+    Returns a key identifying the kind of failure. Only the stable `reason` of errors
+    raised by the analysis is included (never names from the query), so that the
+    number of distinct keys stays small.
+    """
+    reason = getattr(error, "reason", None)
+    if isinstance(reason, str):
+        return f"{type(error).__name__}: {reason}"
+    return type(error).__name__
+
+
+def _get_latency_bucket(milliseconds: float) -> str:
+    for bound in LATENCY_BUCKETS_MS:
+        if milliseconds <= bound:
+            return f"<={bound}"
+    return f">{LATENCY_BUCKETS_MS[-1]}"
+
+
+class TimeTotals(BaseModel):
+    model_config = ConfigDict(defer_build=True)
+
+    count: int = 0
+    total_seconds: float = 0
+    max_seconds: float = 0
+
+    def merge(self, other: "TimeTotals") -> "TimeTotals":
+        return TimeTotals(
+            count=self.count + other.count,
+            total_seconds=self.total_seconds + other.total_seconds,
+            max_seconds=max(self.max_seconds, other.max_seconds),
+        )
+
+
+def _merge_times(
+    a: Dict[str, TimeTotals], b: Dict[str, TimeTotals]
+) -> Dict[str, TimeTotals]:
+    merged = dict(a)
+    for key, totals in b.items():
+        merged[key] = merged.get(key, TimeTotals()).merge(totals)
+    return merged
+
+
+def _add_time(times: Dict[str, TimeTotals], key: str, seconds: float) -> None:
+    times[key] = times.get(key, TimeTotals()).merge(
+        TimeTotals(count=1, total_seconds=seconds, max_seconds=seconds)
+    )
+
+
+class AnalysisStats(BaseModel):
+    """
+    - `failure_reasons` — Counts of statements that could not be analyzed, keyed by
+      exception type and (for errors raised by the analysis) a stable reason.
+
+    - `unknown_expression_reasons` — Counts of result columns classified as
+      `UnknownExpression`, keyed by reason.
+
+    - `join_count`, `cte_depth`, `output_width` — Histograms mapping each observed
+      value to the number of statements having that value. Statements which can't be
+      parsed are counted under "unparsed" in `join_count` and `cte_depth`, so that
+      those histograms always add up to `statements`. Output width is only recorded
+      for statements that were analyzed successfully.
+
+    - `analysis_time` — Time spent analyzing, keyed by outcome: either "ok" or the
+      failure reason.
+
+    - `analysis_time_by_join_count`, `analysis_time_by_cte_depth`,
+      `analysis_time_by_output_width` — Time spent analyzing, keyed by the buckets of
+      the corresponding histogram, to show which shapes of statement cost the most.
+      Each covers the same statements as its histogram.
+
+    - `latency_ms` — Histogram of per-statement analysis time. See
+      `LATENCY_BUCKETS_MS`.
+    """
+
+    model_config = ConfigDict(defer_build=True)
+
+    statements: int = 0
+    succeeded: int = 0
+    failure_reasons: Dict[str, int] = {}
+    unknown_expression_reasons: Dict[str, int] = {}
+    join_count: Dict[str, int] = {}
+    cte_depth: Dict[str, int] = {}
+    output_width: Dict[str, int] = {}
+    analysis_time: Dict[str, TimeTotals] = {}
+    analysis_time_by_join_count: Dict[str, TimeTotals] = {}
+    analysis_time_by_cte_depth: Dict[str, TimeTotals] = {}
+    analysis_time_by_output_width: Dict[str, TimeTotals] = {}
+    latency_ms: Dict[str, int] = {}
+
+    def merge(self, other: "AnalysisStats") -> "AnalysisStats":
+        return AnalysisStats(
+            statements=self.statements + other.statements,
+            succeeded=self.succeeded + other.succeeded,
+            failure_reasons=_merge_counts(self.failure_reasons, other.failure_reasons),
+            unknown_expression_reasons=_merge_counts(
+                self.unknown_expression_reasons, other.unknown_expression_reasons
+            ),
+            join_count=_merge_counts(self.join_count, other.join_count),
+            cte_depth=_merge_counts(self.cte_depth, other.cte_depth),
+            output_width=_merge_counts(self.output_width, other.output_width),
+            analysis_time=_merge_times(self.analysis_time, other.analysis_time),
+            analysis_time_by_join_count=_merge_times(
+                self.analysis_time_by_join_count, other.analysis_time_by_join_count
+            ),
+            analysis_time_by_cte_depth=_merge_times(
+                self.analysis_time_by_cte_depth, other.analysis_time_by_cte_depth
+            ),
+            analysis_time_by_output_width=_merge_times(
+                self.analysis_time_by_output_width, other.analysis_time_by_output_width
+            ),
+            latency_ms=_merge_counts(self.latency_ms, other.latency_ms),
+        )
+
+
+class _ShapeVisitor(Visitor):
+    """
+    Measures the join count and CTE nesting depth of a parsed statement. Both explicit
+    joins and comma-separated FROM items count as joins.
+    """
+
+    join_count: int
+    cte_depth: int
+
+    def __init__(self) -> None:
+        self.join_count = 0
+        self.cte_depth = 0
+
+    def visit_JoinExpr(self, ancestors: Ancestor, node: JoinExpr) -> None:
+        self.join_count += 1
+
+    def visit_SelectStmt(self, ancestors: Ancestor, node: SelectStmt) -> None:
+        if node.fromClause:
+            self.join_count += len(node.fromClause) - 1
+
+    def visit_CommonTableExpr(self, ancestors: Ancestor, node: CommonTableExpr) -> None:
+        depth = 1
+        ancestor: Optional[Ancestor] = ancestors
+        while ancestor is not None:
+            if isinstance(ancestor.node, CommonTableExpr):
+                depth += 1
+            ancestor = ancestor.parent
+        self.cte_depth = max(self.cte_depth, depth)
+
+
+class StatsCollector:
+    """
+    Wraps `analyze_sql`, recording statistics about each statement analyzed. Results
+    and exceptions are passed through unchanged.
+    """
+
+    _failure_reasons: Counter[str]
+    _unknown_expression_reasons: Counter[str]
+    _join_count: Counter[str]
+    _cte_depth: Counter[str]
+    _output_width: Counter[str]
+    _analysis_time: Dict[str, TimeTotals]
+    _analysis_time_by_join_count: Dict[str, TimeTotals]
+    _analysis_time_by_cte_depth: Dict[str, TimeTotals]
+    _analysis_time_by_output_width: Dict[str, TimeTotals]
+    _latency_ms: Counter[str]
+    _statements: int
+    _succeeded: int
+
+    def __init__(self) -> None:
+        self._failure_reasons = Counter()
+        self._unknown_expression_reasons = Counter()
+        self._join_count = Counter()
+        self._cte_depth = Counter()
+        self._output_width = Counter()
+        self._analysis_time = dict()
+        self._analysis_time_by_join_count = dict()
+        self._analysis_time_by_cte_depth = dict()
+        self._analysis_time_by_output_width = dict()
+        self._latency_ms = Counter()
+        self._statements = 0
+        self._succeeded = 0
+
+    def _record_shape(self, sql: str) -> Tuple[str, str]:
+        """Returns the `join_count` and `cte_depth` buckets of the statement"""
+        try:
+            ast = parse_sql(sql)
+        except Exception:
+            join_count, cte_depth = UNPARSED, UNPARSED
+        else:
+            visitor = _ShapeVisitor()
+            visitor(ast)
+            join_count, cte_depth = str(visitor.join_count), str(visitor.cte_depth)
+        self._join_count[join_count] += 1
+        self._cte_depth[cte_depth] += 1
+        return join_count, cte_depth
+
+    def _record_result(
+        self, relation_structure: RelationStructure, seconds: float
+    ) -> None:
+        self._succeeded += 1
+        output_width = str(len(relation_structure.result_columns))
+        self._output_width[output_width] += 1
+        _add_time(self._analysis_time_by_output_width, output_width, seconds)
+        for column in relation_structure.result_columns:
+            if isinstance(column.definition, UnknownExpression):
+                reason = column.definition.reason or "Unknown"
+                self._unknown_expression_reasons[reason] += 1
+
+    def _record_time(
+        self, outcome: str, shape: Tuple[str, str], seconds: float
+    ) -> None:
+        join_count, cte_depth = shape
+        _add_time(self._analysis_time, outcome, seconds)
+        _add_time(self._analysis_time_by_join_count, join_count, seconds)
+        _add_time(self._analysis_time_by_cte_depth, cte_depth, seconds)
+        self._latency_ms[_get_latency_bucket(seconds * 1000)] += 1
+
+    def analyze_sql(
+        self,
+        database_structure: ReadableDatabaseStructure,
+        sql: str,
+        search_path: Optional[Sequence[str]] = None,
+    ) -> RelationStructure:
+        self._statements += 1
+        # Parsing again here is wasteful, but it keeps the analysis itself unaware of
+        # statistics, and the cost is only paid when statistics are requested.
+        shape = self._record_shape(sql)
+        start = time.perf_counter()
+        try:
+            relation_structure = analyze_sql(database_structure, sql, search_path)
+        except Exception as e:
+            reason = _get_failure_reason(e)
+            self._failure_reasons[reason] += 1
+            self._record_time(reason, shape, time.perf_counter() - start)
+            raise
+        seconds = time.perf_counter() - start
+        self._record_time(OK, shape, seconds)
+        self._record_result(relation_structure, seconds)
+        return relation_structure
+
+    def get_stats(self) -> AnalysisStats:
+        return AnalysisStats(
+            statements=self._statements,
+            succeeded=self._succeeded,
+            failure_reasons=dict(self._failure_reasons),
+            unknown_expression_reasons=dict(self._unknown_expression_reasons),
+            join_count=dict(self._join_count),
+            cte_depth=dict(self._cte_depth),
+            output_width=dict(self._output_width),
+            analysis_time=dict(self._analysis_time),
+            analysis_time_by_join_count=dict(self._analysis_time_by_join_count),
+            analysis_time_by_cte_depth=dict(self._analysis_time_by_cte_depth),
+            analysis_time_by_output_width=dict(self._analysis_time_by_output_width),
+            latency_ms=dict(self._latency_ms),
+        )
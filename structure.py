@@ -1,4 +1,6 @@
-from pydantic import BaseModel
+import threading
+from collections import OrderedDict
+from pydantic import BaseModel, ConfigDict, PrivateAttr
 from typing import *
 
 
@@ -20,11 +22,15 @@ class RelationReference(BaseModel):
       not explicitly specified when the relation is referenced in the query.
     """
 
+    model_config = ConfigDict(defer_build=True)
+
     name: str
     schema_name: Optional[str] = None
 
 
 class Column(BaseModel):
+    model_config = ConfigDict(defer_build=True)
+
     name: str
     attnum: int
     type: str
@@ -39,10 +45,14 @@ class LookupColumnSet(BaseModel):
     in the set.
     """
 
+    model_config = ConfigDict(defer_build=True)
+
     column_names: list[str]
 
 
 class Table(BaseModel):
+    model_config = ConfigDict(defer_build=True)
+
     name: str
     oid: int
     columns: dict[str, Column]
@@ -50,11 +60,172 @@ class Table(BaseModel):
 
 
 class Schema(BaseModel):
+    model_config = ConfigDict(defer_build=True)
+
     name: str
     oid: int
     tables: dict[str, Table]
 
 
+class ReadableTable(Protocol):
+    """The parts of `Table` read during analysis"""
+
+    @property
+    def name(self) -> str: ...
+
+    @property
+    def oid(self) -> int: ...
+
+    @property
+    def columns(self) -> Mapping[str, Column]: ...
+
+    @property
+    def lookup_column_sets(self) -> Sequence[LookupColumnSet]: ...
+
+
+class ReadableSchema(Protocol):
+    """The parts of `Schema` read during analysis"""
+
+    @property
+    def name(self) -> str: ...
+
+    @property
+    def oid(self) -> int: ...
+
+    @property
+    def tables(self) -> Mapping[str, ReadableTable]: ...
+
+
+class SearchPathIndex:
+    """
+    Maps unqualified relation names to the first table visible on a search path, as
+    PostgreSQL would resolve them. Schemas on the search path which don't exist in the
+    database structure are skipped.
+    """
+
+    search_path: tuple[str, ...]
+    _tables: dict[str, tuple[ReadableSchema, ReadableTable]]
+
+    def __init__(
+        self, schemas: Mapping[str, ReadableSchema], search_path: Sequence[str]
+    ):
+        self.search_path = tuple(search_path)
+        self._tables = dict()
+        # Walk the path in reverse so that earlier schemas overwrite later ones.
+        for schema_name in reversed(self.search_path):
+            schema = schemas.get(schema_name)
+            if schema is None:
+                continue
+            for table_name, table in schema.tables.items():
+                self._tables[table_name] = (schema, table)
+
+    def get_table(
+        self, relation_name: str
+    ) -> Optional[tuple[ReadableSchema, ReadableTable]]:
+        return self._tables.get(relation_name)
+
+
+class ReadableDatabaseStructure(Protocol):
+    """
+    The parts of `DatabaseStructure` read during analysis. Anything implementing this
+    (such as `compact_structure.CompactDatabaseStructure`) can be analyzed.
+    """
+
+    @property
+    def schemas(self) -> Mapping[str, ReadableSchema]: ...
+
+    @property
+    def current_schema(self) -> str: ...
+
+    @property
+    def search_path(self) -> Optional[Sequence[str]]: ...
+
+    def get_search_path_index(
+        self, search_path: Optional[Sequence[str]] = None
+    ) -> SearchPathIndex: ...
+
+
+def get_default_search_path(
+    database_structure: ReadableDatabaseStructure,
+) -> list[str]:
+    if database_structure.search_path is None:
+        return [database_structure.current_schema]
+    return list(database_structure.search_path)
+
+
+class SearchPathIndexCache:
+    """
+    Holds the most recently used `SearchPathIndex` for each of up to `max_size` search
+    paths, so that per-query search path overrides can't grow memory without bound.
+
+    This is safe to share between threads. Cached indexes are not pickled; they are
+    rebuilt on demand after unpickling.
+    """
+
+    max_size: int
+    _indexes: OrderedDict[tuple[str, ...], SearchPathIndex]
+    _lock: threading.Lock
+
+    def __init__(self, max_size: int = 32):
+        self.max_size = max_size
+        self._indexes = OrderedDict()
+        self._lock = threading.Lock()
+
+    def __len__(self) -> int:
+        return len(self._indexes)
+
+    def __getstate__(self) -> dict[str, Any]:
+        return {"max_size": self.max_size}
+
+    def __setstate__(self, state: dict[str, Any]) -> None:
+        self.__init__(state["max_size"])  # type: ignore[misc]
+
+    def get(
+        self,
+        database_structure: ReadableDatabaseStructure,
+        search_path: Optional[Sequence[str]] = None,
+    ) -> SearchPathIndex:
+        """
+        Returns the index for `search_path`, or for the structure's default search
+        path if it is None.
+        """
+        if search_path is None:
+            search_path = get_default_search_path(database_structure)
+        key = tuple(search_path)
+        with self._lock:
+            index = self._indexes.get(key)
+            if index is not None:
+                self._indexes.move_to_end(key)
+                return index
+        # Built outside the lock, since this can take a while for large structures. Two
+        # threads may occasionally build the same index; the last one wins.
+        index = SearchPathIndex(database_structure.schemas, key)
+        with self._lock:
+            self._indexes[key] = index
+            self._indexes.move_to_end(key)
+            while len(self._indexes) > self.max_size:
+                self._indexes.popitem(last=False)
+        return index
+
+
 class DatabaseStructure(BaseModel):
+    """
+    - `search_path` — The schemas searched, in order, when resolving unqualified
+      relation names. Defaults to just `current_schema`.
+    """
+
+    model_config = ConfigDict(defer_build=True)
+
     schemas: dict[str, Schema]
     current_schema: str
+    search_path: Optional[list[str]] = None
+
+    # Built on demand by `get_search_path_index` and reused across queries.
+    _search_path_indexes: SearchPathIndexCache = PrivateAttr(
+        default_factory=SearchPathIndexCache
+    )
+
+    def get_search_path_index(
+        self, search_path: Optional[Sequence[str]] = None
+    ) -> SearchPathIndex:
+        return self._search_path_indexes.get(self, search_path)
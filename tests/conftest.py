@@ -0,0 +1,58 @@
+import json
+from typing import *
+
+import pytest
+
+from structure import DatabaseStructure
+
+
+@pytest.fixture(scope="session")
+def structure_path() -> str:
+    return "tests/test_data/issue_tracker_schema.json"
+
+
+@pytest.fixture(scope="session")
+def structure_json(structure_path: str) -> str:
+    with open(structure_path) as f:
+        return f.read()
+
+
+@pytest.fixture(scope="session")
+def structure(structure_json: str) -> DatabaseStructure:
+    """Shared by many tests, so it must not be modified"""
+    return DatabaseStructure.model_validate_json(structure_json)
+
+
+def build_structure_data(table_count: int, column_count: int) -> Dict[str, Any]:
+    """
+    Returns the JSON-compatible data of a synthetic structure with one schema,
+    "public", holding tables named "table_0", "table_1", etc., each with columns named
+    "column_0", "column_1", etc. and "column_0" as its lookup column set.
+    """
+    types = ["integer", "text", "boolean", "timestamp with time zone"]
+
+    def build_table(i: int) -> Dict[str, Any]:
+        columns = {
+            f"column_{j}": {
+                "name": f"column_{j}",
+                "attnum": j + 1,
+                "type": types[j % len(types)],
+                "mutable": j > 0,
+            }
+            for j in range(column_count)
+        }
+        lookup_column_sets = [{"column_names": ["column_0"]}]
+        return {
+            "name": f"table_{i}",
+            "oid": i,
+            "columns": columns,
+            "lookup_column_sets": lookup_column_sets,
+        }
+
+    tables = {f"table_{i}": build_table(i) for i in range(table_count)}
+    schema = {"name": "public", "oid": 2200, "tables": tables}
+    return {"schemas": {"public": schema}, "current_schema": "public"}
+
+
+def build_structure_json(table_count: int, column_count: int) -> str:
+    return json.dumps(build_structure_data(table_count, column_count))
@@ -0,0 +1,161 @@
+import asyncio
+import threading
+import time
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import *
+
+import pytest
+
+from analyze import analyze_sql
+from analyze_async import AnalyzerBusyError, AsyncAnalyzer
+
+
+class SlowExecutor(ThreadPoolExecutor):
+    """Delays each job, and records how many jobs were submitted and run at once"""
+
+    def __init__(self, delay: float):
+        super().__init__(max_workers=8)
+        self.delay = delay
+        self.submitted = 0
+        self.completed = 0
+        self.max_running = 0
+        self._running = 0
+        self._lock = threading.Lock()
+
+    def submit(self, fn, /, *args, **kwargs) -> Future:
+        self.submitted += 1
+
+        def run() -> Any:
+            with self._lock:
+                self._running += 1
+                self.max_running = max(self.max_running, self._running)
+            try:
+                time.sleep(self.delay)
+                return fn(*args, **kwargs)
+            finally:
+                with self._lock:
+                    self._running -= 1
+                    self.completed += 1
+
+        return super().submit(run)
+
+
+@pytest.mark.parametrize("executor", ["thread", "process"])
+def test_matches_synchronous_result(structure, executor):
+    sql = "SELECT id, title FROM issues;"
+
+    async def run() -> None:
+        async with AsyncAnalyzer(structure, executor=executor) as analyzer:
+            assert await analyzer.analyze_sql(sql) == analyze_sql(structure, sql)
+            with pytest.raises(NotImplementedError):
+                await analyzer.analyze_sql("UPDATE issues SET title = 'x';")
+
+    asyncio.run(run())
+
+
+def test_identical_requests_are_coalesced(structure):
+    executor = SlowExecutor(delay=0.05)
+
+    async def run() -> None:
+        analyzer = AsyncAnalyzer(structure, executor=executor)
+        requests = [analyzer.analyze_sql("SELECT id FROM issues;") for _ in range(10)]
+        results = await asyncio.gather(*requests)
+        assert len(set(id(r) for r in results)) == 1
+        await analyzer.close()
+
+    asyncio.run(run())
+    assert executor.submitted == 1
+    executor.shutdown()
+
+
+def test_concurrency_is_limited(structure):
+    executor = SlowExecutor(delay=0.02)
+
+    async def run() -> None:
+        analyzer = AsyncAnalyzer(structure, executor=executor, max_concurrency=2)
+        requests = [
+            analyzer.analyze_sql(f"SELECT id FROM issues -- {i}") for i in range(8)
+        ]
+        await asyncio.gather(*requests)
+
+    asyncio.run(run())
+    assert executor.submitted == 8
+    assert executor.max_running == 2
+    executor.shutdown()
+
+
+def test_timeout_does_not_affect_coalesced_callers(structure):
+    executor = SlowExecutor(delay=0.2)
+    sql = "SELECT id FROM issues;"
+
+    async def run() -> None:
+        analyzer = AsyncAnalyzer(structure, executor=executor)
+        patient = asyncio.create_task(analyzer.analyze_sql(sql))
+        with pytest.raises(TimeoutError):
+            await analyzer.analyze_sql(sql, timeout=0.01)
+        assert await patient == analyze_sql(structure, sql)
+
+    asyncio.run(run())
+    assert executor.submitted == 1
+    executor.shutdown()
+
+
+def test_cancelled_requests_do_not_run(structure):
+    executor = SlowExecutor(delay=0.1)
+
+    async def run() -> None:
+        analyzer = AsyncAnalyzer(structure, executor=executor, max_concurrency=1)
+        requests = [
+            asyncio.create_task(analyzer.analyze_sql(f"SELECT id FROM issues -- {i}"))
+            for i in range(10)
+        ]
+        await asyncio.sleep(0.02)
+        for request in requests:
+            request.cancel()
+        await asyncio.gather(*requests, return_exceptions=True)
+        # The first request had already started and can't be interrupted, but the
+        # queued ones must never be submitted.
+        await asyncio.sleep(0.2)
+        assert executor.submitted == 1
+        assert await analyzer.analyze_sql("SELECT id FROM issues;")
+
+    asyncio.run(run())
+    assert executor.completed == 2
+    executor.shutdown()
+
+
+def test_timeout_of_last_caller_cancels_analysis(structure):
+    executor = SlowExecutor(delay=0.1)
+
+    async def run() -> None:
+        analyzer = AsyncAnalyzer(structure, executor=executor, max_concurrency=1)
+        running = analyzer.analyze_sql("SELECT id FROM issues -- running")
+        queued = analyzer.analyze_sql("SELECT id FROM issues -- queued", timeout=0.01)
+        results = await asyncio.gather(running, queued, return_exceptions=True)
+        assert isinstance(results[1], TimeoutError)
+
+    asyncio.run(run())
+    assert executor.submitted == 1
+    executor.shutdown()
+
+
+def test_new_requests_are_rejected_past_max_pending(structure):
+    executor = SlowExecutor(delay=0.05)
+
+    async def run() -> None:
+        analyzer = AsyncAnalyzer(
+            structure, executor=executor, max_concurrency=1, max_pending=2
+        )
+        first = asyncio.create_task(analyzer.analyze_sql("SELECT id FROM issues -- 1"))
+        second = asyncio.create_task(analyzer.analyze_sql("SELECT id FROM issues -- 2"))
+        await asyncio.sleep(0)
+        with pytest.raises(AnalyzerBusyError):
+            await analyzer.analyze_sql("SELECT id FROM issues -- 3")
+        # Joining a pending analysis doesn't add work, so it is still accepted.
+        joined = await analyzer.analyze_sql("SELECT id FROM issues -- 2")
+        assert joined is await second
+        await first
+        assert await analyzer.analyze_sql("SELECT id FROM issues -- 3")
+
+    asyncio.run(run())
+    executor.shutdown()
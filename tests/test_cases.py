@@ -1,16 +1,20 @@
 import pytest
 
 from analysis import RelationStructure
-from structure import DatabaseStructure
 from utils.markdown_test_cases import get_test_cases
 from analyze import analyze_sql
 
 
 @pytest.mark.parametrize("case", list(get_test_cases("tests/straightforward_cases.md")))
-def test_straightforward_cases(case):
-    with open("tests/test_data/issue_tracker_schema.json") as f:
-        structure = DatabaseStructure.model_validate_json(f.read())
+def test_straightforward_cases(structure, case):
     [sql_input, expected_json] = case.parameters
     actual = analyze_sql(structure, sql_input)
     expected = RelationStructure.model_validate_json(expected_json)
     assert actual == expected
+
+
+def test_ctes_do_not_leak_between_queries(structure):
+    # Analyses sharing one structure must not see each other's CTEs.
+    analyze_sql(structure, "WITH zz AS (SELECT id FROM issues) SELECT id FROM zz;")
+    with pytest.raises(ValueError):
+        analyze_sql(structure, "SELECT id FROM zz;")
@@ -0,0 +1,103 @@
+import gc
+import tracemalloc
+from typing import *
+
+import pytest
+
+from analysis import RelationStructure
+from analyze import analyze_sql
+from compact_structure import CompactDatabaseStructure, load_compact_structure
+from prefork import warm_structure
+from structure import DatabaseStructure
+from tests.conftest import build_structure_json
+from utils.markdown_test_cases import get_test_cases
+
+@pytest.fixture(scope="module")
+def compact_structure(structure_json) -> CompactDatabaseStructure:
+    return load_compact_structure(structure_json)
+
+
+@pytest.mark.parametrize("case", list(get_test_cases("tests/straightforward_cases.md")))
+def test_straightforward_cases(compact_structure, case):
+    [sql_input, expected_json] = case.parameters
+    actual = analyze_sql(compact_structure, sql_input)
+    expected = RelationStructure.model_validate_json(expected_json)
+    assert actual == expected
+
+
+def test_read_api(structure, compact_structure):
+    for schema_name, schema in structure.schemas.items():
+        compact_schema = compact_structure.schemas[schema_name]
+        assert (compact_schema.name, compact_schema.oid) == (schema.name, schema.oid)
+        for table_name, table in schema.tables.items():
+            compact_table = compact_schema.tables[table_name]
+            assert compact_table.name == table.name
+            assert compact_table.oid == table.oid
+            assert dict(compact_table.columns) == table.columns
+            assert list(compact_table.columns.values()) == list(table.columns.values())
+            assert compact_table.lookup_column_sets == table.lookup_column_sets
+
+
+def _measure_allocated_bytes(load: Callable[[], Any]) -> int:
+    tracemalloc.start()
+    try:
+        loaded = load()
+        size, _ = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+    del loaded
+    return size
+
+
+def test_uses_less_memory():
+    json_text = build_structure_json(table_count=500, column_count=20)
+    full = _measure_allocated_bytes(
+        lambda: DatabaseStructure.model_validate_json(json_text)
+    )
+    compact = _measure_allocated_bytes(lambda: load_compact_structure(json_text))
+    assert compact < full / 3
+
+
+def test_stays_compact_after_warming_and_analyzing():
+    # Build pydantic's validators for the analysis models first, so that their one-off
+    # cost isn't counted below.
+    small = load_compact_structure(build_structure_json(table_count=1, column_count=1))
+    analyze_sql(small, "SELECT column_0 FROM table_0")
+
+    json_text = build_structure_json(table_count=500, column_count=20)
+    tracemalloc.start()
+    try:
+        structure = load_compact_structure(json_text)
+        loaded, _ = tracemalloc.get_traced_memory()
+        warm_structure(structure, relation_structures=True)
+        for i in range(500):
+            analyze_sql(structure, f"SELECT column_0, column_1 FROM table_{i}")
+        gc.collect()
+        used, _ = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+    # Only the search path index is retained, not a relation structure per table.
+    assert used - loaded < loaded * 0.25
+
+
+def test_column_lookup_by_name():
+    structure = load_compact_structure(
+        build_structure_json(table_count=1, column_count=1000)
+    )
+    columns = structure.schemas["public"].tables["table_0"].columns
+    assert columns["column_999"].attnum == 1000
+    assert "column_500" in columns
+    assert "missing" not in columns
+    assert 1 not in columns
+    with pytest.raises(KeyError):
+        columns["missing"]
+
+
+def test_analysis_does_not_build_column_indexes():
+    # These indexes are not built by `prefork.warm_structure`, so analyzing must not
+    # need them, or each forked worker would build its own.
+    structure = load_compact_structure(build_structure_json(2, 3))
+    warm_structure(structure)
+    analyze_sql(structure, "SELECT column_0, column_2 FROM table_1")
+    for table in structure.schemas["public"].tables.values():
+        assert table._column_indexes is None
@@ -0,0 +1,74 @@
+import io
+import json
+import subprocess
+import sys
+
+import pytest
+
+from analyze import analyze_sql, stream_sql
+from output import stream_relation_structure
+from utils.markdown_test_cases import get_test_cases
+
+@pytest.mark.parametrize("indent", [None, 2])
+@pytest.mark.parametrize("case", list(get_test_cases("tests/straightforward_cases.md")))
+def test_streamed_output_matches_model_dump_json(structure, case, indent):
+    [sql_input, _] = case.parameters
+    expected = analyze_sql(structure, sql_input).model_dump_json(indent=indent)
+    out = io.StringIO()
+    stream_relation_structure(out, stream_sql(structure, sql_input), indent)
+    assert out.getvalue() == expected
+
+
+def test_batch_writes_one_line_per_statement(structure, structure_path):
+    sql = "SELECT id FROM issues; UPDATE issues SET title = 'x'; SELEC 1; SELECT 1"
+    completed = subprocess.run(
+        [sys.executable, "query-lens.py", "-s", structure_path, "--batch", "-q", sql],
+        check=True,
+        capture_output=True,
+        text=True,
+    )
+    lines = completed.stdout.splitlines()
+    assert len(lines) == 4
+    assert lines[0] == analyze_sql(structure, "SELECT id FROM issues").model_dump_json()
+    assert json.loads(lines[1])["error"]["type"] == "UnsupportedQueryError"
+    assert json.loads(lines[2])["error"]["message"].startswith("Invalid SQL")
+    assert lines[3] == analyze_sql(structure, "SELECT 1").model_dump_json()
+
+
+class FlushCountingStringIO(io.StringIO):
+    flushes = 0
+
+    def flush(self) -> None:
+        self.flushes += 1
+        super().flush()
+
+
+def test_streamed_columns_are_flushed(structure):
+    out = FlushCountingStringIO()
+    stream_relation_structure(out, stream_sql(structure, "SELECT id, title FROM issues"))
+    # One flush per result column and per pk mapping
+    assert out.flushes == 3
+
+
+def test_stream_failure_ends_with_error_line(structure_path):
+    completed = subprocess.run(
+        [
+            sys.executable,
+            "query-lens.py",
+            "-s",
+            structure_path,
+            "--stream",
+            "-q",
+            "SELECT id, 1 + 1 FROM issues;",
+        ],
+        capture_output=True,
+        text=True,
+    )
+    assert completed.returncode == 1
+    lines = completed.stdout.splitlines()
+    assert lines[0].startswith("{")
+    error = json.loads(lines[-1])["error"]
+    assert error == {
+        "type": "UnsupportedQueryError",
+        "message": "Unsupported expression: A_Expr",
+    }
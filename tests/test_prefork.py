@@ -0,0 +1,169 @@
+import gc
+import json
+import os
+import subprocess
+import sys
+from typing import *
+
+import pytest
+
+from analyze import analyze_sql
+from prefork import freeze_structure, warm_structure
+from structure import DatabaseStructure
+from tests.conftest import build_structure_data
+
+SMAPS_ROLLUP = "/proc/self/smaps_rollup"
+
+
+def _read_smaps_rollup() -> dict[str, int]:
+    """Returns memory stats for the current process, in kB"""
+    result: dict[str, int] = dict()
+    with open(SMAPS_ROLLUP) as f:
+        for line in f:
+            parts = line.split()
+            if len(parts) == 3 and parts[2] == "kB":
+                result[parts[0].rstrip(":")] = int(parts[1])
+    return result
+
+
+WORKER_QUERY = "SELECT column_0, column_1 FROM table_7;"
+
+
+def _run_workers(structure: DatabaseStructure, worker_count: int) -> List[int]:
+    """
+    Forks workers that each run a full garbage collection and a query, then report how
+    many kB of memory they had to copy from the parent.
+    """
+    pids: List[int] = []
+    read_fds: List[int] = []
+    for _ in range(worker_count):
+        read_fd, write_fd = os.pipe()
+        pid = os.fork()
+        if pid == 0:
+            os.close(read_fd)
+            gc.collect()
+            analyze_sql(structure, WORKER_QUERY).model_dump_json()
+            private_dirty = _read_smaps_rollup()["Private_Dirty"]
+            os.write(write_fd, str(private_dirty).encode())
+            os._exit(0)
+        os.close(write_fd)
+        pids.append(pid)
+        read_fds.append(read_fd)
+
+    results: List[int] = []
+    for read_fd in read_fds:
+        with os.fdopen(read_fd) as f:
+            results.append(int(f.read()))
+    for pid in pids:
+        os.waitpid(pid, 0)
+    return results
+
+
+def measure_fleet(
+    worker_count: int,
+    freeze: bool,
+    relation_structures: bool = False,
+    run_query_first: bool = False,
+) -> Dict[str, Any]:
+    """
+    Builds a large structure, optionally freezes it, and forks workers. Returns the RSS
+    cost (in kB) of building and of freezing in the parent, and the number of kB each
+    worker copied. With `run_query_first`, the parent runs the workers' query itself
+    before freezing, which is the best any warming could do.
+
+    This is meant to run in a fresh interpreter (see `_measure_fleet_in_subprocess`)
+    so that memory freed by other tests doesn't distort the RSS measurements.
+    """
+    # The data is generated before measuring so that only the structure is counted.
+    data = build_structure_data(table_count=2000, column_count=20)
+    rss_before = _read_smaps_rollup()["Rss"]
+    structure = DatabaseStructure.model_validate(data)
+    rss_built = _read_smaps_rollup()["Rss"]
+    del data
+    if run_query_first:
+        analyze_sql(structure, WORKER_QUERY).model_dump_json()
+    if freeze:
+        freeze_structure(structure, relation_structures)
+    rss_frozen = _read_smaps_rollup()["Rss"]
+    return {
+        "structure": rss_built - rss_before,
+        "freeze": rss_frozen - rss_built,
+        "copied": _run_workers(structure, worker_count),
+    }
+
+
+def _measure_fleet_in_subprocess(
+    worker_count: int,
+    freeze: bool,
+    relation_structures: bool = False,
+    run_query_first: bool = False,
+) -> Dict[str, Any]:
+    arguments = f"{worker_count}, {freeze}, {relation_structures}, {run_query_first}"
+    code = "\n".join(
+        [
+            "import json",
+            "from tests.test_prefork import measure_fleet",
+            f"result = measure_fleet({arguments})",
+            "print(json.dumps(result))",
+        ]
+    )
+    completed = subprocess.run(
+        [sys.executable, "-c", code], check=True, capture_output=True, text=True
+    )
+    return json.loads(completed.stdout)
+
+
+requires_fork_and_smaps = pytest.mark.skipif(
+    not hasattr(os, "fork") or not os.path.exists(SMAPS_ROLLUP),
+    reason="Requires fork and /proc/self/smaps_rollup",
+)
+
+
+@pytest.fixture(scope="module")
+def unfrozen() -> Dict[str, Any]:
+    return _measure_fleet_in_subprocess(1, freeze=False)
+
+
+@requires_fork_and_smaps
+@pytest.mark.parametrize("worker_count", [1, 2, 4, 8])
+def test_forked_workers_share_frozen_structure(unfrozen, worker_count):
+    [unfrozen_copied] = unfrozen["copied"]
+    frozen = _measure_fleet_in_subprocess(worker_count, freeze=True)
+
+    assert len(frozen["copied"]) == worker_count
+    # Without freezing, the collector makes each worker copy nearly the whole structure.
+    for kb in frozen["copied"]:
+        assert kb < unfrozen_copied * 0.25
+
+    # Freezing itself must be cheap, so that the fleet as a whole uses less memory.
+    assert frozen["freeze"] < frozen["structure"] * 0.25
+    frozen_total = frozen["structure"] + frozen["freeze"] + sum(frozen["copied"])
+    unfrozen_total = unfrozen["structure"] + unfrozen_copied * worker_count
+    assert frozen_total < unfrozen_total
+
+
+@requires_fork_and_smaps
+def test_workers_do_not_build_analysis_models():
+    frozen = _measure_fleet_in_subprocess(3, freeze=True)
+    ideal = _measure_fleet_in_subprocess(3, freeze=True, run_query_first=True)
+    # Without building the models' validators and serializers in the parent, each
+    # worker would copy about twice as much as when the parent ran the query itself.
+    for kb, ideal_kb in zip(frozen["copied"], ideal["copied"]):
+        assert kb < ideal_kb * 1.1 + 128
+
+
+@requires_fork_and_smaps
+def test_warming_relation_structures_has_bounded_cost():
+    warmed = _measure_fleet_in_subprocess(1, freeze=True, relation_structures=True)
+    assert warmed["freeze"] < warmed["structure"] * 3
+
+
+def test_warming_relation_structures_leaves_tables_unchanged():
+    data = build_structure_data(table_count=3, column_count=2)
+    structure = DatabaseStructure.model_validate(data)
+    copy = structure.model_copy(deep=True)
+    warm_structure(structure, relation_structures=True)
+    tables = structure.schemas["public"].tables
+    assert tables == copy.schemas["public"].tables
+    for table in tables.values():
+        assert table.__pydantic_private__ is None
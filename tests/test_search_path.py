@@ -0,0 +1,108 @@
+import pytest
+
+from analysis import DataReference
+from analyze import analyze_sql
+from structure import Column, DatabaseStructure, Schema, Table
+
+
+def _build_table(name: str, oid: int) -> Table:
+    column = Column(name="id", attnum=1, type="integer", mutable=False)
+    return Table(name=name, oid=oid, columns={"id": column}, lookup_column_sets=[])
+
+
+@pytest.fixture
+def structure() -> DatabaseStructure:
+    schemas = {
+        "public": Schema(
+            name="public",
+            oid=1,
+            tables={"a": _build_table("a", 10), "b": _build_table("b", 11)},
+        ),
+        "app": Schema(name="app", oid=2, tables={"a": _build_table("a", 20)}),
+    }
+    return DatabaseStructure(
+        schemas=schemas, current_schema="public", search_path=["app", "public"]
+    )
+
+
+def _get_source_table_oid(
+    structure: DatabaseStructure, sql: str, search_path=None
+) -> int:
+    result = analyze_sql(structure, sql, search_path)
+    definition = result.result_columns[0].definition
+    assert isinstance(definition, DataReference)
+    return definition.ultimate_source.table_reference.oid
+
+
+def test_earlier_schemas_shadow_later_ones(structure):
+    assert _get_source_table_oid(structure, "SELECT id FROM a") == 20
+    assert _get_source_table_oid(structure, "SELECT id FROM b") == 11
+
+
+def test_search_path_can_be_overridden_per_query(structure):
+    assert _get_source_table_oid(structure, "SELECT id FROM a", ["public"]) == 10
+    with pytest.raises(ValueError):
+        analyze_sql(structure, "SELECT id FROM b", ["app"])
+
+
+def test_qualified_names_ignore_search_path(structure):
+    assert _get_source_table_oid(structure, "SELECT id FROM public.a") == 10
+
+
+def test_missing_schemas_are_skipped(structure):
+    search_path = ["missing", "public"]
+    assert _get_source_table_oid(structure, "SELECT id FROM a", search_path) == 10
+
+
+def test_default_search_path_is_current_schema(structure):
+    structure.search_path = None
+    assert _get_source_table_oid(structure, "SELECT id FROM a") == 10
+
+
+def test_index_is_reused(structure):
+    index = structure.get_search_path_index()
+    assert structure.get_search_path_index(["app", "public"]) is index
+    assert structure.get_search_path_index(["public"]) is not index
+
+
+def _get_source_table_oids(structure: DatabaseStructure, sql: str, search_path=None):
+    result = analyze_sql(structure, sql, search_path)
+    oids = []
+    for column in result.result_columns:
+        assert isinstance(column.definition, DataReference)
+        oids.append(column.definition.ultimate_source.table_reference.oid)
+    return oids
+
+
+def test_qualified_columns_resolve_against_from_clause(structure):
+    assert _get_source_table_oids(structure, "SELECT a.id FROM app.a") == [20]
+    assert _get_source_table_oids(structure, "SELECT a.id FROM a, public.b") == [20]
+    assert _get_source_table_oids(structure, "SELECT b.id FROM a, public.b") == [11]
+    assert _get_source_table_oids(structure, "SELECT app.a.id FROM a") == [20]
+    sql = "SELECT x.id, y.id FROM public.a AS x JOIN a AS y ON true"
+    assert _get_source_table_oids(structure, sql) == [10, 20]
+
+
+def test_qualified_columns_must_match_actual_schema(structure):
+    result = analyze_sql(structure, "SELECT public.a.id FROM a")
+    assert not isinstance(result.result_columns[0].definition, DataReference)
+
+
+def test_current_schema_not_required_with_explicit_search_path(structure):
+    structure.current_schema = "missing"
+    assert _get_source_table_oid(structure, "SELECT id FROM a") == 20
+    structure.search_path = None
+    assert _get_source_table_oid(structure, "SELECT id FROM a", ["public"]) == 10
+    with pytest.raises(ValueError):
+        analyze_sql(structure, "SELECT id FROM a")
+
+
+def test_search_path_indexes_are_bounded(structure):
+    for i in range(100):
+        analyze_sql(structure, "SELECT id FROM b", [f"s{i}", "public"])
+    assert len(structure._search_path_indexes) == 32
+
+
+def test_same_table_name_from_different_schemas(structure):
+    sql = "SELECT app.a.id, public.a.id FROM app.a, public.a"
+    assert _get_source_table_oids(structure, sql) == [20, 10]
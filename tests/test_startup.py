@@ -0,0 +1,32 @@
+import subprocess
+import sys
+
+
+def _run_python(*args: str) -> subprocess.CompletedProcess:
+    return subprocess.run(
+        [sys.executable, *args], check=True, capture_output=True, text=True
+    )
+
+
+def test_help_does_not_import_analysis_dependencies():
+    completed = _run_python("-X", "importtime", "query-lens.py", "--help")
+    imported = {line.split("|")[-1].strip() for line in completed.stderr.splitlines()}
+    assert "argparse" in imported
+    for module in ["pglast", "pydantic", "analyze", "analysis", "structure"]:
+        assert module not in imported
+
+
+def test_importing_does_not_build_models():
+    code = "\n".join(
+        [
+            "import analyze, analysis, structure",
+            "print(structure.DatabaseStructure.__pydantic_complete__)",
+            "print(analysis.RelationStructure.__pydantic_complete__)",
+        ]
+    )
+    completed = _run_python("-c", code)
+    assert completed.stdout.split() == ["False", "False"]
+
+
+def test_help_meets_startup_budget():
+    _run_python("benchmarks/startup.py", "--runs", "5")
@@ -0,0 +1,106 @@
+from typing import *
+
+import pytest
+
+from stats import AnalysisStats, StatsCollector
+from structure import DatabaseStructure
+
+STATEMENTS = [
+    "SELECT id FROM issues;",
+    "SELECT i.id, u.username FROM issues i JOIN users u ON u.id = i.author;",
+    "WITH a AS (WITH b AS (SELECT id FROM issues) SELECT id FROM b) SELECT id FROM a;",
+    "UPDATE issues SET title = 'x';",
+    "SELECT id, title + 1 FROM issues;",
+]
+
+
+def _collect(structure: DatabaseStructure, statements: List[str]) -> AnalysisStats:
+    collector = StatsCollector()
+    for sql in statements:
+        try:
+            collector.analyze_sql(structure, sql)
+        except (NotImplementedError, ValueError):
+            pass
+    return collector.get_stats()
+
+
+def test_collector_aggregates_statements(structure):
+    stats = _collect(structure, STATEMENTS)
+    assert stats.statements == 5
+    assert stats.succeeded == 3
+    assert stats.failure_reasons == {
+        "UnsupportedQueryError: Unsupported statement: UpdateStmt": 1,
+        "UnsupportedQueryError: Unsupported expression: A_Expr": 1,
+    }
+    assert stats.join_count == {"0": 4, "1": 1}
+    assert stats.cte_depth == {"0": 4, "2": 1}
+    assert stats.output_width == {"1": 2, "2": 1}
+    assert stats.analysis_time["ok"].count == 3
+    assert sum(stats.latency_ms.values()) == 5
+
+
+def test_stats_merge_across_json(structure):
+    first = _collect(structure, STATEMENTS[:2])
+    second = _collect(structure, STATEMENTS[2:])
+    second = AnalysisStats.model_validate_json(second.model_dump_json())
+    merged = first.merge(second)
+    expected = _collect(structure, STATEMENTS)
+    assert merged.statements == expected.statements
+    assert merged.succeeded == expected.succeeded
+    assert merged.failure_reasons == expected.failure_reasons
+    assert merged.join_count == expected.join_count
+    assert merged.cte_depth == expected.cte_depth
+    assert merged.output_width == expected.output_width
+    assert merged.analysis_time["ok"].count == expected.analysis_time["ok"].count
+    for field in [
+        "analysis_time_by_join_count",
+        "analysis_time_by_cte_depth",
+        "analysis_time_by_output_width",
+    ]:
+        merged_counts = {k: t.count for k, t in getattr(merged, field).items()}
+        expected_counts = {k: t.count for k, t in getattr(expected, field).items()}
+        assert merged_counts == expected_counts
+
+
+def test_collector_counts_unknown_expressions(structure):
+    stats = _collect(structure, ["SELECT id, nope, x.y.z.w FROM issues;"])
+    assert stats.succeeded == 1
+    assert stats.unknown_expression_reasons == {
+        "Unable to resolve column.": 1,
+        "Unsupported number of ColumnRef fields. Expected 1-3. Got 4.": 1,
+    }
+
+
+def test_failure_reasons_do_not_include_names_from_queries(structure):
+    statements = [f"SELECT id FROM missing_{i};" for i in range(5)]
+    stats = _collect(structure, statements)
+    reason = "UnresolvableQueryError: Unable to resolve relation"
+    assert stats.failure_reasons == {reason: 5}
+    assert set(stats.analysis_time) == {reason}
+
+
+def test_unparsed_statements_are_counted(structure):
+    stats = _collect(structure, ["SELECT id FROM issues;", "SELEC nonsense;"])
+    assert stats.statements == 2
+    assert stats.failure_reasons == {"UnsupportedQueryError: Invalid SQL": 1}
+    assert stats.join_count == {"0": 1, "unparsed": 1}
+    assert stats.cte_depth == {"0": 1, "unparsed": 1}
+
+
+def test_comma_joins_are_counted(structure):
+    sql = "SELECT i.id FROM issues i, users u JOIN teams t ON t.id = u.team;"
+    stats = _collect(structure, [sql])
+    assert stats.join_count == {"2": 1}
+
+
+def test_analysis_time_is_recorded_per_bucket(structure):
+    stats = _collect(structure, STATEMENTS + ["SELEC nonsense;"])
+    for histogram, times in [
+        (stats.join_count, stats.analysis_time_by_join_count),
+        (stats.cte_depth, stats.analysis_time_by_cte_depth),
+        (stats.output_width, stats.analysis_time_by_output_width),
+    ]:
+        assert {bucket: t.count for bucket, t in times.items()} == histogram
+        for totals in times.values():
+            assert 0 < totals.max_seconds <= totals.total_seconds
+    assert stats.analysis_time_by_join_count["unparsed"].count == 1